@@ -3,6 +3,10 @@ import numpy as np
 import tensorflow as tf
 import os
 
+from capture import FrameGrabber, open_camera
+from postprocess import channels_first, dequantize_output, postprocess, write_input
+
+# A full-integer export (see model.ipynb) can be dropped in here; inputs/outputs adapt to its dtype
 YOLO_PATH = r"d:\Iris\COCO\yolov8n.tflite"
 
 CLASSES = {
@@ -56,7 +60,10 @@ def estimate_distance(known_height, apparent_height_pixels):
     return (known_height * FOCAL_LENGTH) / apparent_height_pixels
 
 def load_tflite_model(model_path):
-    interpreter = tf.lite.Interpreter(model_path=model_path)
+    # Multi-threaded interpreter; TF >= 2.9 routes float ops through the XNNPACK delegate by default.
+    # One core is left free for capture and drawing.
+    num_threads = max(1, (os.cpu_count() or 1) - 1)
+    interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
     interpreter.allocate_tensors()
     return interpreter
 
@@ -70,104 +77,61 @@ def main():
     yolo_input_details = yolo_interpreter.get_input_details()
     yolo_output_details = yolo_interpreter.get_output_details()
     _, yolo_in_height, yolo_in_width, _ = yolo_input_details[0]['shape']
+    yolo_input_tensor = yolo_interpreter.tensor(yolo_input_details[0]['index'])
+    yolo_output_tensor = yolo_interpreter.tensor(yolo_output_details[0]['index'])
+    yolo_resized = np.empty((yolo_in_height, yolo_in_width, 3), dtype=np.uint8)
     print("Model loaded successfully.")
 
-    cap = cv2.VideoCapture(0)
+    cap = open_camera(0)
+    # Capture runs on its own thread; each iteration takes the newest frame instead of waiting on cap.read()
+    grabber = FrameGrabber(cap)
+    grabber.start()
     print("Starting webcam... Press 'q' to quit.")
 
+    frame_id = -1
     while True:
-        ret, frame = cap.read()
-        if not ret:
+        frame_id, frame = grabber.read(frame_id)
+        if frame is None:
             print("Failed to grab frame from webcam")
             break
 
         orig_height, orig_width = frame.shape[:2]
 
         # YOLOv8 preprocessing
-        yolo_input_frame = cv2.resize(frame, (yolo_in_width, yolo_in_height))
-        yolo_input_frame = yolo_input_frame / 255.0
-        yolo_input_frame = yolo_input_frame.astype(np.float32)
-        yolo_input_frame = np.expand_dims(yolo_input_frame, axis=0)
-
-        yolo_interpreter.set_tensor(yolo_input_details[0]['index'], yolo_input_frame)
+        write_input(frame, yolo_input_details[0], yolo_input_tensor, yolo_resized)
         yolo_interpreter.invoke()
-        yolo_output = yolo_interpreter.get_tensor(yolo_output_details[0]['index'])
-        
-        # Parse YOLO output
-        out = yolo_output[0]
-        if out.shape[0] == 84:
-            out = out.transpose(1, 0)
+        # The output is read in place; postprocess returns fresh arrays, so no view of the
+        # interpreter's buffer outlives this statement
+        cv2_boxes, class_ids, confidences = postprocess(
+            channels_first(dequantize_output(yolo_output_tensor()[0], yolo_output_details[0])),
+            yolo_in_width, yolo_in_height, orig_width, orig_height, 0.4, 0.45)
+
+        for (x, y, w, h), conf, class_id in zip(cv2_boxes.tolist(), confidences.tolist(), class_ids.tolist()):
+            label = CLASSES.get(class_id, "Unknown")
             
-        boxes = out[:, :4]
-        scores = out[:, 4:]
-        class_ids = np.argmax(scores, axis=1)
-        confidences = np.max(scores, axis=1)
-        
-        # Filter low confidence
-        score_threshold = 0.4
-        valid_indices = confidences > score_threshold
-        boxes = boxes[valid_indices]
-        class_ids = class_ids[valid_indices]
-        confidences = confidences[valid_indices]
-        
-        is_normalized = np.max(boxes) <= 2.0 if len(boxes) > 0 else False
-        
-        cv2_boxes = []
-        for box, class_id in zip(boxes, class_ids):
-            cx, cy, w, h = box
-            
-            if is_normalized:
-                cx *= orig_width
-                cy *= orig_height
-                w *= orig_width
-                h *= orig_height
-            else:
-                cx *= (orig_width / yolo_in_width)
-                cy *= (orig_height / yolo_in_height)
-                w *= (orig_width / yolo_in_width)
-                h *= (orig_height / yolo_in_height)
+            # Estimate distance using bounding box height
+            known_h = KNOWN_HEIGHTS.get(label, DEFAULT_HEIGHT)
+            distance_cm = estimate_distance(known_h, h)
+            distance_m = distance_cm / 100.0
+
+            text = f"{label} {conf:.2f} | Dist: {distance_m:.2f}m"
             
-            x_min = int(cx - w / 2)
-            y_min = int(cy - h / 2)
+            # Draw box and label
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
             
-            cv2_boxes.append([x_min, y_min, int(w), int(h)])
+            # Background for text
+            (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+            cv2.rectangle(frame, (x, y - text_height - baseline - 5), (x + text_width, y), (0, 255, 0), -1)
             
-        nms_boxes = []
-        max_wh = 7680 # Avoid NMS cross-class suppression
-        for j, b in enumerate(cv2_boxes):
-            nms_boxes.append([b[0] + class_ids[j] * max_wh, b[1] + class_ids[j] * max_wh, b[2], b[3]])
-
-        indices = cv2.dnn.NMSBoxes(nms_boxes, confidences.tolist(), score_threshold, 0.45)
-
-        if len(indices) > 0:
-            for i in indices.flatten():
-                x, y, w, h = cv2_boxes[i]
-                conf = confidences[i]
-                class_id = class_ids[i]
-                label = CLASSES.get(class_id, "Unknown")
-                
-                # Estimate distance using bounding box height
-                known_h = KNOWN_HEIGHTS.get(label, DEFAULT_HEIGHT)
-                distance_cm = estimate_distance(known_h, h)
-                distance_m = distance_cm / 100.0
-
-                text = f"{label} {conf:.2f} | Dist: {distance_m:.2f}m"
-                
-                # Draw box and label
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                
-                # Background for text
-                (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-                cv2.rectangle(frame, (x, y - text_height - baseline - 5), (x + text_width, y), (0, 255, 0), -1)
-                
-                cv2.putText(frame, text, (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-                print(f"Detected: {label}, Conf: {conf:.2f}, Box: [{x},{y},{w},{h}], Est. Dist: {distance_m:.2f}m")
+            cv2.putText(frame, text, (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
+            print(f"Detected: {label}, Conf: {conf:.2f}, Box: [{x},{y},{w},{h}], Est. Dist: {distance_m:.2f}m")
 
         cv2.imshow("YOLO Box Distance Estimation", frame)
 
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
+    grabber.stop()
     cap.release()
     cv2.destroyAllWindows()
 
@@ -0,0 +1,51 @@
+import threading
+
+import cv2
+
+
+def open_camera(index=0):
+    cap = cv2.VideoCapture(index)
+    # MJPG cuts USB bandwidth and the YUYV->BGR conversion; a one-frame driver buffer keeps reads
+    # from returning stale frames. Backends that do not support either setting ignore it.
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+
+class FrameGrabber(threading.Thread):
+    # Reads the camera continuously on its own thread and keeps only the newest frame, so the
+    # inference loop never blocks on cap.read(). cap.read() hands out a new array every call,
+    # so a frame can be given to the consumer without copying it.
+    def __init__(self, cap):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.cond = threading.Condition()
+        self.frame = None
+        self.frame_id = -1
+        self.failed = False
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            ret, frame = self.cap.read()
+            with self.cond:
+                if not ret:
+                    self.failed = True
+                    self.cond.notify_all()
+                    break
+                self.frame = frame
+                self.frame_id += 1
+                self.cond.notify_all()
+
+    def read(self, last_id=-1, timeout=5.0):
+        # Returns (frame_id, frame) for the newest frame after last_id, or (last_id, None) if the
+        # camera stopped delivering frames
+        with self.cond:
+            self.cond.wait_for(lambda: self.frame_id > last_id or self.failed, timeout)
+            if self.frame_id <= last_id:
+                return last_id, None
+            return self.frame_id, self.frame
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
@@ -2,9 +2,38 @@ import cv2
 import numpy as np
 import tensorflow as tf
 import os
+import queue
+import threading
+from functools import partial
 
+from capture import open_camera
+from postprocess import channels_first, dequantize_output, postprocess, write_input
+
+try:
+    from onnx_backend import OnnxInterpreter
+except ImportError:
+    OnnxInterpreter = None
+
+# A full-integer export (see model.ipynb) can be dropped in here; inputs/outputs adapt to its dtype
 YOLO_PATH = r"d:\Iris\COCO\yolov8n.tflite"
 MIDAS_PATH = r"d:\Iris\COCO\midas_v21_small_256.tflite"
+# Optional ONNX conversions of both models (python -m tf2onnx.convert --tflite <model>.tflite --output <model>.onnx).
+# When present and onnxruntime is installed they run on its CUDA/DirectML/CPU providers instead of TFLite.
+YOLO_ONNX_PATH = r"d:\Iris\COCO\yolov8n.onnx"
+MIDAS_ONNX_PATH = r"d:\Iris\COCO\midas_v21_small_256.onnx"
+# TFLite GPU (OpenCL) delegate used for MiDaS; falls back to the CPU interpreter if it cannot be loaded
+GPU_DELEGATE_PATH = "tensorflowlite_gpu_delegate.dll" if os.name == "nt" else "libtensorflowlite_gpu_delegate.so"
+GPU_DELEGATE_OPTIONS = {"precision_loss_allowed": "1", "inference_preference": "sustained_speed"}
+# MiDaS ImageNet normalization (x / 255 - mean) / std folded into one per-channel scale and bias
+MIDAS_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+MIDAS_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+MIDAS_SCALE = (1.0 / 255.0) / MIDAS_STD
+MIDAS_BIAS = -MIDAS_MEAN / MIDAS_STD
+# Depth changes slowly compared to the camera frame rate, so MiDaS only runs on every Nth frame
+# and the frames in between reuse the last depth map
+MIDAS_STRIDE = 3
+# Relative depth of a detection is the mean over a (2r+1)x(2r+1) patch around its center
+DEPTH_PATCH_RADIUS = 4
 
 CLASSES = {
   0: "person", 1: "bicycle", 2: "car", 3: "motorcycle", 4: "airplane", 5: "bus",
@@ -26,173 +55,275 @@ CLASSES = {
   79: "toothbrush"
 }
 
-def load_tflite_model(model_path):
-    interpreter = tf.lite.Interpreter(model_path=model_path)
+def load_tflite_model(model_path, num_threads, delegate_path=None, delegate_options=None):
+    # Multi-threaded interpreter; TF >= 2.9 routes float ops through the XNNPACK delegate by default
+    if delegate_path is not None:
+        try:
+            delegate = tf.lite.experimental.load_delegate(delegate_path, delegate_options or {})
+            interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads,
+                                              experimental_delegates=[delegate])
+            interpreter.allocate_tensors()
+            return interpreter
+        except (ValueError, RuntimeError) as e:
+            print(f"Could not use delegate {delegate_path} ({e}), falling back to CPU")
+    interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
     interpreter.allocate_tensors()
     return interpreter
 
+def load_model(tflite_path, onnx_path, num_threads, delegate_path=None, delegate_options=None):
+    # Prefer an onnxruntime session when the ONNX conversion exists; it exposes the same interpreter API
+    if OnnxInterpreter is not None and os.path.exists(onnx_path):
+        interpreter = OnnxInterpreter(onnx_path, num_threads)
+        print(f"Running {onnx_path} with onnxruntime ({interpreter.session.get_providers()[0]})")
+        return interpreter
+    return load_tflite_model(tflite_path, num_threads, delegate_path, delegate_options)
+
+def write_midas_input(frame, input_tensor, resized_u8):
+    # MiDaS expects ImageNet-normalized RGB; written straight into the interpreter's input buffer
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    cv2.resize(rgb, (resized_u8.shape[1], resized_u8.shape[0]), dst=resized_u8)
+    dst = input_tensor()[0]
+    np.multiply(resized_u8, MIDAS_SCALE, out=dst, dtype=np.float32)
+    np.add(dst, MIDAS_BIAS, out=dst)
+
+def put_latest(q, item):
+    # Drop the oldest entry instead of blocking so a slow stage never backs up the ones before it
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            pass
+        q.put_nowait(item)
+
+def capture_loop(cap, yolo_q, midas_q, stop_event):
+    # Whatever ends this stage, including an exception, stops the whole pipeline
+    try:
+        frame_id = 0
+        while not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                print("Failed to grab frame from webcam")
+                break
+            put_latest(yolo_q, (frame_id, frame))
+            if frame_id % MIDAS_STRIDE == 0:
+                put_latest(midas_q, (frame_id, frame))
+            frame_id += 1
+    finally:
+        stop_event.set()
+
+def yolo_loop(interpreter, raw_q, det_q, stop_event):
+    # Whatever ends this stage, including an exception, stops the whole pipeline
+    try:
+        input_details = interpreter.get_input_details()
+        output_details = interpreter.get_output_details()
+        _, yolo_in_height, yolo_in_width, _ = input_details[0]['shape']
+        input_tensor = interpreter.tensor(input_details[0]['index'])
+        output_tensor = interpreter.tensor(output_details[0]['index'])
+        resized = np.empty((yolo_in_height, yolo_in_width, 3), dtype=np.uint8)
+
+        while not stop_event.is_set():
+            try:
+                frame_id, frame = raw_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            orig_height, orig_width = frame.shape[:2]
+
+            # YOLOv8 typical input preprocessing
+            write_input(frame, input_details[0], input_tensor, resized)
+            interpreter.invoke()
+            # The output is read in place; postprocess returns fresh arrays, so no view of the
+            # interpreter's buffer outlives this statement
+            cv2_boxes, class_ids, confidences = postprocess(
+                channels_first(dequantize_output(output_tensor()[0], output_details[0])),
+                yolo_in_width, yolo_in_height, orig_width, orig_height, 0.25, 0.45)
+
+            detections = list(zip(cv2_boxes.tolist(), confidences.tolist(), class_ids.tolist()))
+
+            put_latest(det_q, (frame_id, frame, detections))
+    finally:
+        stop_event.set()
+
+def midas_loop(make_interpreter, raw_q, depth_q, stop_event):
+    # The interpreter is built here rather than passed in: the TFLite GPU delegate has to be invoked on
+    # the thread that created it
+    # Whatever ends this stage, including an exception, stops the whole pipeline
+    try:
+        interpreter = make_interpreter()
+        input_details = interpreter.get_input_details()
+        output_details = interpreter.get_output_details()
+        _, midas_in_height, midas_in_width, _ = input_details[0]['shape']
+        input_tensor = interpreter.tensor(input_details[0]['index'])
+        output_tensor = interpreter.tensor(output_details[0]['index'])
+        resized = np.empty((midas_in_height, midas_in_width, 3), dtype=np.uint8)
+
+        # Output buffers are allocated once the frame size is known and handed out round-robin.
+        # The ring is larger than what depth_q plus the display thread can hold, so a buffer is
+        # never overwritten while the display thread is still copying it out.
+        depth_buffers = None
+        buffer_idx = 0
+
+        while not stop_event.is_set():
+            try:
+                frame_id, frame = raw_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            orig_height, orig_width = frame.shape[:2]
+            if depth_buffers is None or depth_buffers[0][0].shape != (orig_height, orig_width):
+                depth_buffers = [
+                    (np.empty((orig_height, orig_width), dtype=np.float32),
+                     np.empty((orig_height, orig_width), dtype=np.uint8),
+                     np.empty((orig_height, orig_width, 3), dtype=np.uint8))
+                    for _ in range(depth_q.maxsize + 2)
+                ]
+            depth_full, depth_uint8, depth_colormap = depth_buffers[buffer_idx]
+            buffer_idx = (buffer_idx + 1) % len(depth_buffers)
+
+            # MiDaS typical input preprocessing
+            write_midas_input(frame, input_tensor, resized)
+            interpreter.invoke()
+            # Read the output in place; the view is dropped before the next invoke()
+            depth_map = output_tensor()[0]
+            if depth_map.ndim == 3: # In some outputs, depth has shape (H, W, 1)
+                depth_map = np.squeeze(depth_map)
+            cv2.resize(depth_map, (orig_width, orig_height), dst=depth_full)
+            del depth_map
+        
+            # Normalize depth map for display (single min-max pass straight to uint8)
+            cv2.normalize(depth_full, depth_uint8, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+            cv2.applyColorMap(depth_uint8, cv2.COLORMAP_INFERNO, dst=depth_colormap)
+
+            put_latest(depth_q, (frame_id, depth_uint8, depth_colormap))
+    finally:
+        stop_event.set()
+
+def model_exists(tflite_path, onnx_path):
+    # load_model() accepts either format for each model
+    return os.path.exists(tflite_path) or (OnnxInterpreter is not None and os.path.exists(onnx_path))
+
 def main():
-    if not os.path.exists(YOLO_PATH) or not os.path.exists(MIDAS_PATH):
-        print(f"Error: Make sure both tflite models exist at {YOLO_PATH} and {MIDAS_PATH}")
+    if not model_exists(YOLO_PATH, YOLO_ONNX_PATH) or not model_exists(MIDAS_PATH, MIDAS_ONNX_PATH):
+        print(f"Error: Make sure both models exist, as tflite ({YOLO_PATH}, {MIDAS_PATH}) "
+              f"or onnx ({YOLO_ONNX_PATH}, {MIDAS_ONNX_PATH})")
         return
 
     print("Loading models...")
-    yolo_interpreter = load_tflite_model(YOLO_PATH)
-    yolo_input_details = yolo_interpreter.get_input_details()
-    yolo_output_details = yolo_interpreter.get_output_details()
-    _, yolo_in_height, yolo_in_width, _ = yolo_input_details[0]['shape']
-
-    midas_interpreter = load_tflite_model(MIDAS_PATH)
-    midas_input_details = midas_interpreter.get_input_details()
-    midas_output_details = midas_interpreter.get_output_details()
-    _, midas_in_height, midas_in_width, _ = midas_input_details[0]['shape']
-    print("Models loaded successfully.")
-
-    cap = cv2.VideoCapture(0)
+    # One interpreter per worker thread; an interpreter is never shared between threads.
+    # With TFLite, YOLO stays on the CPU and the conv-heavy MiDaS goes to the GPU delegate when available.
+    # Both interpreters run at the same time, so the cores left after one for capture and drawing are
+    # split between them instead of giving each its own full-size thread pool
+    model_cores = max(2, (os.cpu_count() or 1) - 1)
+    yolo_threads = model_cores // 2
+    midas_threads = model_cores - yolo_threads
+    yolo_interpreter = load_model(YOLO_PATH, YOLO_ONNX_PATH, yolo_threads)
+    # MiDaS (and its GPU delegate) is loaded on its worker thread
+    make_midas_interpreter = partial(load_model, MIDAS_PATH, MIDAS_ONNX_PATH, midas_threads,
+                                     GPU_DELEGATE_PATH, GPU_DELEGATE_OPTIONS)
+    print("YOLO model loaded successfully.")
+
+    cap = open_camera(0)
     print("Starting webcam... Press 'q' to quit.")
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Failed to grab frame from webcam")
+    # Capture, YOLO and MiDaS run as overlapping stages; the main thread pairs their results and draws
+    yolo_raw_q = queue.Queue(maxsize=2)
+    midas_raw_q = queue.Queue(maxsize=2)
+    det_q = queue.Queue(maxsize=2)
+    depth_q = queue.Queue(maxsize=2)
+    stop_event = threading.Event()
+    workers = [
+        threading.Thread(target=capture_loop, args=(cap, yolo_raw_q, midas_raw_q, stop_event), daemon=True),
+        threading.Thread(target=yolo_loop, args=(yolo_interpreter, yolo_raw_q, det_q, stop_event), daemon=True),
+        threading.Thread(target=midas_loop, args=(make_midas_interpreter, midas_raw_q, depth_q, stop_event), daemon=True),
+    ]
+    for worker in workers:
+        worker.start()
+
+    # Persistent display-side buffers, allocated once the first results arrive
+    latest_depth_id = -1
+    depth_padded = None
+    depth_colormap = None
+    stacked_screen = None
+    while not stop_event.is_set():
+        try:
+            frame_id, frame, detections = det_q.get(timeout=0.1)
+        except queue.Empty:
+            # Keep the window responsive (and 'q' working) while waiting for results
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+            continue
+
+        # Join on frame id: wait for the depth map of the last MiDaS frame at or before this one,
+        # or a newer one if MiDaS dropped it
+        depth_frame_id = frame_id - frame_id % MIDAS_STRIDE
+        while not stop_event.is_set() and latest_depth_id < depth_frame_id:
+            try:
+                latest_depth_id, new_uint8, new_colormap = depth_q.get(timeout=0.1)
+            except queue.Empty:
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    stop_event.set()
+                continue
+            # The MiDaS thread recycles its output buffers, so keep a private copy of the latest map.
+            # The depth copy is edge-padded so patches around centers near the border stay in bounds.
+            r = DEPTH_PATCH_RADIUS
+            padded_shape = (new_uint8.shape[0] + 2 * r, new_uint8.shape[1] + 2 * r)
+            if depth_padded is None or depth_padded.shape != padded_shape:
+                depth_padded = np.empty(padded_shape, dtype=np.uint8)
+                depth_colormap = np.empty_like(new_colormap)
+            cv2.copyMakeBorder(new_uint8, r, r, r, r, cv2.BORDER_REPLICATE, dst=depth_padded)
+            np.copyto(depth_colormap, new_colormap)
+        if depth_padded is None:
             break
 
         orig_height, orig_width = frame.shape[:2]
+        if stacked_screen is None or stacked_screen.shape[:2] != (orig_height, 2 * orig_width):
+            stacked_screen = np.empty((orig_height, 2 * orig_width, 3), dtype=np.uint8)
+
+        # Frame and depth map are written side by side into one screen buffer and annotated in place
+        combined_frame = stacked_screen[:, :orig_width]
+        depth_panel = stacked_screen[:, orig_width:]
+        combined_frame[...] = frame
+        depth_panel[...] = depth_colormap
 
         # ==========================================
-        # 1. Run YOLO Object Detection
+        # Visualization and Result Merging
         # ==========================================
-        # YOLOv8 typical input preprocessing
-        yolo_input_frame = cv2.resize(frame, (yolo_in_width, yolo_in_height))
-        yolo_input_frame = yolo_input_frame / 255.0
-        yolo_input_frame = yolo_input_frame.astype(np.float32)
-        yolo_input_frame = np.expand_dims(yolo_input_frame, axis=0)
-
-        yolo_interpreter.set_tensor(yolo_input_details[0]['index'], yolo_input_frame)
-        yolo_interpreter.invoke()
-        yolo_output = yolo_interpreter.get_tensor(yolo_output_details[0]['index'])
-        
-        # Parse YOLO output (handles [1, 84, 8400] or [1, 8400, 84] variants)
-        out = yolo_output[0]
-        if out.shape[0] == 84:
-            out = out.transpose(1, 0)
+        for (x, y, w, h), conf, class_id in detections:
+            label = CLASSES.get(class_id, "Unknown")
             
-        boxes = out[:, :4]
-        scores = out[:, 4:]
-        class_ids = np.argmax(scores, axis=1)
-        confidences = np.max(scores, axis=1)
-        
-        # Filtering low confidence defaults
-        score_threshold = 0.25
-        valid_indices = confidences > score_threshold
-        boxes = boxes[valid_indices]
-        class_ids = class_ids[valid_indices]
-        confidences = confidences[valid_indices]
-        
-        # Check if boxes are normalized (between 0 and 1)
-        is_normalized = np.max(boxes) <= 2.0 if len(boxes) > 0 else False
-        
-        cv2_boxes = []
-        for box in boxes:
-            cx, cy, w, h = box
+            # Estimate depth around the center of the bounding box (center clamped to the frame;
+            # the padding keeps the patch in bounds)
+            cx = int(x + w/2)
+            cy = int(y + h/2)
+            cx = max(0, min(cx, orig_width - 1))
+            cy = max(0, min(cy, orig_height - 1))
+            depth_patch = depth_padded[cy:cy + 2 * DEPTH_PATCH_RADIUS + 1, cx:cx + 2 * DEPTH_PATCH_RADIUS + 1]
+            rel_depth_val = int(depth_patch.mean())
             
-            if is_normalized:
-                cx *= orig_width
-                cy *= orig_height
-                w *= orig_width
-                h *= orig_height
-            else:
-                # Rescale coordinate to original frame dimensions
-                cx *= (orig_width / yolo_in_width)
-                cy *= (orig_height / yolo_in_height)
-                w *= (orig_width / yolo_in_width)
-                h *= (orig_height / yolo_in_height)
+            text = f"{label} {conf:.2f} (Rel Dist: {rel_depth_val})"
             
-            x_min = int(cx - w / 2)
-            y_min = int(cy - h / 2)
-            cv2_boxes.append([x_min, y_min, int(w), int(h)])
+            # Plot box and text on the raw color frame
+            cv2.rectangle(combined_frame, (x, y), (x + w, y + h), (0, 255, 0), 3)
+            cv2.putText(combined_frame, text, (max(0, x), max(10, y - 5)), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                        
+            # Also plot box and text on the colorized depth map
+            cv2.rectangle(depth_panel, (x, y), (x + w, y + h), (255, 255, 255), 3)
+            cv2.putText(depth_panel, text, (max(0, x), max(10, y - 5)), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)                
             
-        # Class-aware NMS to avoid different classes suppressing each other
-        max_wh = 7680  # large offset
-        nms_boxes = []
-        for j, b in enumerate(cv2_boxes):
-            nms_boxes.append([b[0] + class_ids[j] * max_wh, b[1] + class_ids[j] * max_wh, b[2], b[3]])
-
-        # NMS to remove overlapping boxes
-        indices = cv2.dnn.NMSBoxes(nms_boxes, confidences.tolist(), score_threshold, 0.45)
+            print(f"Object: {label}, Confidence: {conf:.2f}, Box: [{x},{y},{w},{h}], Rel Dist: {rel_depth_val}")
 
-        # ==========================================
-        # 2. Run MiDaS Depth Estimation
-        # ==========================================
-        # MiDaS typical input preprocessing
-        midas_input_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        midas_input_frame = cv2.resize(midas_input_frame, (midas_in_width, midas_in_height))
-        midas_input_frame = midas_input_frame.astype(np.float32) / 255.0
-
-        midas_mean = [0.485, 0.456, 0.406]
-        midas_std = [0.229, 0.224, 0.225]
-        midas_input_frame = (midas_input_frame - midas_mean) / midas_std
-        midas_input_frame = np.expand_dims(midas_input_frame, axis=0).astype(np.float32)
-
-        midas_interpreter.set_tensor(midas_input_details[0]['index'], midas_input_frame)
-        midas_interpreter.invoke()
-        midas_output = midas_interpreter.get_tensor(midas_output_details[0]['index'])
-
-        depth_map = midas_output[0]
-        if depth_map.ndim == 3: # In some outputs, depth has shape (H, W, 1)
-            depth_map = np.squeeze(depth_map)
-        depth_map = cv2.resize(depth_map, (orig_width, orig_height))
-        
-        # Normalize depth map for display
-        depth_min = depth_map.min()
-        depth_max = depth_map.max()
-        if depth_max - depth_min > 0:
-            depth_norm = (depth_map - depth_min) / (depth_max - depth_min)
-        else:
-            depth_norm = depth_map
-        depth_uint8 = (depth_norm * 255).astype(np.uint8)
-        depth_colormap = cv2.applyColorMap(depth_uint8, cv2.COLORMAP_INFERNO)
-        
-        combined_frame = frame.copy()
-
-        # ==========================================
-        # 3. Visualization and Result Merging
-        # ==========================================
-        if len(indices) > 0:
-            for i in indices.flatten():
-                x, y, w, h = cv2_boxes[i]
-                conf = confidences[i]
-                class_id = class_ids[i]
-                label = CLASSES.get(class_id, "Unknown")
-                
-                # Estimate depth at center of bounding box
-                cx = int(x + w/2)
-                cy = int(y + h/2)
-                cx = max(0, min(cx, orig_width - 1))
-                cy = max(0, min(cy, orig_height - 1))
-                rel_depth_val = depth_uint8[cy, cx]
-                
-                text = f"{label} {conf:.2f} (Rel Dist: {rel_depth_val})"
-                
-                # Plot box and text on the raw color frame
-                cv2.rectangle(combined_frame, (x, y), (x + w, y + h), (0, 255, 0), 3)
-                cv2.putText(combined_frame, text, (max(0, x), max(10, y - 5)), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                            
-                # Also plot box and text on the colorized depth map
-                cv2.rectangle(depth_colormap, (x, y), (x + w, y + h), (255, 255, 255), 3)
-                cv2.putText(depth_colormap, text, (max(0, x), max(10, y - 5)), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)                
-                
-                print(f"Object: {label}, Confidence: {conf:.2f}, Box: [{x},{y},{w},{h}], Rel Dist: {rel_depth_val}")
-
-        # Horizontally stack frame and depth map for a unified screen
-        stacked_screen = np.hstack((combined_frame, depth_colormap))
         cv2.imshow("Detection and Depth Map Screens", stacked_screen)
 
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
+    stop_event.set()
+    for worker in workers:
+        worker.join()
     cap.release()
     cv2.destroyAllWindows()
 
@@ -0,0 +1,101 @@
+import numpy as np
+import onnxruntime as ort
+
+# Tried in order; whichever the installed onnxruntime build supports is used
+PROVIDERS = ["CUDAExecutionProvider", "DmlExecutionProvider", "CPUExecutionProvider"]
+
+ORT_DTYPES = {
+    "tensor(float)": np.float32,
+    "tensor(uint8)": np.uint8,
+    "tensor(int8)": np.int8,
+}
+
+
+class OnnxInterpreter:
+    # Stand-in for tf.lite.Interpreter backed by an onnxruntime session. It covers only what the COCO
+    # scripts use: get_input_details(), get_output_details(), tensor() and invoke(). Inputs are numbered
+    # first, then outputs, mirroring TFLite tensor indices. Models are expected to keep TFLite's NHWC
+    # input layout (tf2onnx --tflite does this by default). num_threads caps the intra-op thread pool like
+    # the TFLite interpreter's num_threads; None keeps onnxruntime's default of one thread per core.
+    def __init__(self, model_path, num_threads=None, providers=PROVIDERS):
+        available = ort.get_available_providers()
+        options = ort.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options,
+                                            providers=[p for p in providers if p in available])
+        self._inputs = self.session.get_inputs()
+        self._outputs = self.session.get_outputs()
+        for node in self._inputs + self._outputs:
+            if node.type not in ORT_DTYPES:
+                raise ValueError(f"{model_path}: tensor '{node.name}' has unsupported type {node.type}; "
+                                 f"supported types are {', '.join(ORT_DTYPES)}")
+        self._quantization = self._read_quantization(model_path)
+        self._input_buffers = [
+            np.zeros(self._static_shape(i.shape), dtype=ORT_DTYPES[i.type]) for i in self._inputs
+        ]
+        self._output_values = [None] * len(self._outputs)
+
+    def _read_quantization(self, model_path):
+        # Integer inputs/outputs carry their (scale, zero_point) on the QDQ node next to them, as tf2onnx
+        # emits for full-integer TFLite models: a DequantizeLinear consuming each input and a
+        # QuantizeLinear producing each output. Float tensors get TFLite's (0.0, 0).
+        int_inputs = [n.name for n in self._inputs if ORT_DTYPES[n.type] != np.float32]
+        int_outputs = [n.name for n in self._outputs if ORT_DTYPES[n.type] != np.float32]
+        quantization = {}
+        if not int_inputs and not int_outputs:
+            return quantization
+
+        import onnx
+        from onnx import numpy_helper
+
+        graph = onnx.load(model_path).graph
+        initializers = {init.name: numpy_helper.to_array(init) for init in graph.initializer}
+        for names, op_type, key in ((int_inputs, "DequantizeLinear", "input"),
+                                    (int_outputs, "QuantizeLinear", "output")):
+            for name in names:
+                node = next((n for n in graph.node if n.op_type == op_type and
+                             (n.input[0] == name if key == "input" else n.output[0] == name)), None)
+                if node is None or len(node.input) < 3 or node.input[1] not in initializers \
+                        or node.input[2] not in initializers:
+                    raise ValueError(f"{model_path}: integer {key} '{name}' has no {op_type} node with "
+                                     f"constant scale and zero point to read its quantization from")
+                scale = initializers[node.input[1]]
+                zero_point = initializers[node.input[2]]
+                if scale.size != 1 or zero_point.size != 1:
+                    raise ValueError(f"{model_path}: integer {key} '{name}' is quantized per channel, "
+                                     f"only per-tensor quantization is supported")
+                quantization[name] = (float(scale.item()), int(zero_point.item()))
+        return quantization
+
+    @staticmethod
+    def _static_shape(shape):
+        # Dynamic dims (batch etc.) come back as names or None; run with 1
+        return [d if isinstance(d, int) else 1 for d in shape]
+
+    def _details(self, nodes, offset):
+        return [
+            {
+                'name': node.name,
+                'index': offset + i,
+                'shape': np.array(self._static_shape(node.shape), dtype=np.int32),
+                'dtype': ORT_DTYPES[node.type],
+                'quantization': self._quantization.get(node.name, (0.0, 0)),
+            }
+            for i, node in enumerate(nodes)
+        ]
+
+    def get_input_details(self):
+        return self._details(self._inputs, 0)
+
+    def get_output_details(self):
+        return self._details(self._outputs, len(self._inputs))
+
+    def tensor(self, tensor_index):
+        if tensor_index < len(self._inputs):
+            return lambda: self._input_buffers[tensor_index]
+        return lambda: self._output_values[tensor_index - len(self._inputs)]
+
+    def invoke(self):
+        feeds = {node.name: buf for node, buf in zip(self._inputs, self._input_buffers)}
+        self._output_values = self.session.run(None, feeds)
@@ -0,0 +1,118 @@
+import cv2
+import numpy as np
+from numba import njit
+
+
+def channels_first(out):
+    # YOLOv8 exports come as [84, 8400] or [8400, 84]; postprocess wants one row per box field / class.
+    # The native [84, 8400] layout is passed through untouched and the other is only a transposed view,
+    # so the output is never materialized in a second layout.
+    return out if out.shape[0] < out.shape[1] else out.T
+
+
+def write_input(frame, input_detail, input_tensor, resized_u8):
+    # Fill the interpreter's input buffer in place instead of copying a fresh array in with set_tensor.
+    # `input_tensor` is the callable returned by interpreter.tensor(); the view it hands out must not
+    # outlive this function, since invoke() refuses to run while references to its buffers exist.
+    # Float models expect pixels in [0, 1]; full-integer models take them on their input quantization grid
+    _, in_height, in_width, _ = input_detail['shape']
+    dst = input_tensor()[0]
+    if input_detail['dtype'] == np.float32:
+        cv2.resize(frame, (in_width, in_height), dst=resized_u8)
+        np.multiply(resized_u8, 1 / 255.0, out=dst, dtype=np.float32)
+        return
+    scale, zero_point = input_detail['quantization']
+    if input_detail['dtype'] == np.uint8 and zero_point == 0 and abs(scale * 255.0 - 1.0) < 1e-6:
+        cv2.resize(frame, (in_width, in_height), dst=dst)
+        return
+    cv2.resize(frame, (in_width, in_height), dst=resized_u8)
+    info = np.iinfo(input_detail['dtype'])
+    dst[...] = np.clip(np.round(resized_u8 / (255.0 * scale) + zero_point), info.min, info.max)
+
+
+def dequantize_output(output, output_detail):
+    if output_detail['dtype'] == np.float32:
+        return output
+    scale, zero_point = output_detail['quantization']
+    return (output.astype(np.float32) - zero_point) * scale
+
+
+@njit(cache=True, fastmath=True)
+def postprocess(out, in_width, in_height, orig_width, orig_height, conf_threshold, iou_threshold):
+    # Fused YOLOv8 decode: best class per anchor, confidence filter, rescale of xywh boxes to
+    # top-left xywh in frame pixels, then greedy class-aware NMS. `out` is [4 + num_classes, num_anchors].
+    # Returns (boxes int32 [K, 4], class ids int32 [K], confidences float32 [K]) sorted by confidence.
+    num_classes = out.shape[0] - 4
+    num_anchors = out.shape[1]
+
+    # Best class per anchor; classes are the outer loop so each pass reads one contiguous row
+    best_score = np.empty(num_anchors, dtype=np.float32)
+    best_class = np.zeros(num_anchors, dtype=np.int32)
+    for a in range(num_anchors):
+        best_score[a] = out[4, a]
+    for c in range(1, num_classes):
+        row = out[4 + c]
+        for a in range(num_anchors):
+            if row[a] > best_score[a]:
+                best_score[a] = row[a]
+                best_class[a] = c
+
+    candidates = np.nonzero(best_score > conf_threshold)[0]
+    n = candidates.shape[0]
+
+    # Boxes are either normalized (all coordinates <= 2) or in model input pixels
+    is_normalized = n > 0
+    for k in range(n):
+        for f in range(4):
+            if out[f, candidates[k]] > 2.0:
+                is_normalized = False
+    if is_normalized:
+        sx = float(orig_width)
+        sy = float(orig_height)
+    else:
+        sx = orig_width / in_width
+        sy = orig_height / in_height
+
+    boxes = np.empty((n, 4), dtype=np.int32)
+    scores = np.empty(n, dtype=np.float32)
+    classes = np.empty(n, dtype=np.int32)
+    for k in range(n):
+        a = candidates[k]
+        w = out[2, a] * sx
+        h = out[3, a] * sy
+        boxes[k, 0] = int(out[0, a] * sx - w / 2)
+        boxes[k, 1] = int(out[1, a] * sy - h / 2)
+        boxes[k, 2] = int(w)
+        boxes[k, 3] = int(h)
+        scores[k] = best_score[a]
+        classes[k] = best_class[a]
+
+    # Greedy NMS in descending confidence order; boxes of different classes never suppress each other
+    order = np.argsort(-scores)
+    suppressed = np.zeros(n, dtype=np.bool_)
+    keep = np.empty(n, dtype=np.int64)
+    num_keep = 0
+    for i_pos in range(n):
+        i = order[i_pos]
+        if suppressed[i]:
+            continue
+        keep[num_keep] = i
+        num_keep += 1
+        x1_i, y1_i = boxes[i, 0], boxes[i, 1]
+        x2_i, y2_i = x1_i + boxes[i, 2], y1_i + boxes[i, 3]
+        area_i = boxes[i, 2] * boxes[i, 3]
+        for j_pos in range(i_pos + 1, n):
+            j = order[j_pos]
+            if suppressed[j] or classes[j] != classes[i]:
+                continue
+            inter_w = min(x2_i, boxes[j, 0] + boxes[j, 2]) - max(x1_i, boxes[j, 0])
+            inter_h = min(y2_i, boxes[j, 1] + boxes[j, 3]) - max(y1_i, boxes[j, 1])
+            if inter_w <= 0 or inter_h <= 0:
+                continue
+            inter = inter_w * inter_h
+            union = area_i + boxes[j, 2] * boxes[j, 3] - inter
+            if union > 0 and inter / union > iou_threshold:
+                suppressed[j] = True
+
+    keep = keep[:num_keep]
+    return boxes[keep], classes[keep], scores[keep]
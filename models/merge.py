@@ -1,5 +1,8 @@
 import os
 import shutil
+from multiprocessing import Pool
+from pathlib import Path
+
 import yaml
 
 
@@ -7,6 +10,17 @@ def slugify(name: str) -> str:
     return name.lower().replace(" ", "_").replace("-", "_")
 
 
+def fast_copy(src: str, dst: str) -> None:
+    # Hardlink when source and target share a filesystem; otherwise copyfile, which uses sendfile on Linux
+    try:
+        os.link(src, dst)
+    except OSError:
+        try:
+            shutil.copyfile(src, dst)
+        except shutil.SameFileError:
+            pass
+
+
 script_dir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_dir)
 
@@ -38,77 +52,98 @@ split_map = {
     "val": "val",
 }
 
-# Create directory structure for YOLO dataset
-for split in split_map.values():
-    os.makedirs(os.path.join(target_root, split, "images"), exist_ok=True)
-    os.makedirs(os.path.join(target_root, split, "labels"), exist_ok=True)
-
-for animal, meta in classes.items():
-    class_id = meta["id"]
-    slug = meta["slug"]
-    print(f"\nProcessing {animal}...")
-
-    for src_split, dst_split in split_map.items():
-        img_dir = os.path.join(source_root, animal, src_split, "images")
-        lbl_dir = os.path.join(source_root, animal, src_split, "labels")
-
-        if not os.path.isdir(img_dir):
-            print(f"  Skipping {src_split} (directory not found)")
-            continue
-
-        files = [
-            f
-            for f in os.listdir(img_dir)
-            if f.lower().endswith((".jpg", ".png", ".jpeg", ".webp", ".bmp", ".tif", ".tiff"))
-        ]
-        print(f"  {src_split}: {len(files)} images found")
-
-        for file in files:
-            name, ext = os.path.splitext(file)
-            new_name = f"{slug}_{name}"
-
-            src_img = os.path.join(img_dir, file)
-            dst_img = os.path.join(target_root, dst_split, "images", f"{new_name}{ext}")
-
-            src_lbl = os.path.join(lbl_dir, f"{name}.txt")
-            dst_lbl = os.path.join(target_root, dst_split, "labels", f"{new_name}.txt")
-
-            shutil.copy(src_img, dst_img)
-            print(f"    Copied: {new_name}{ext}")
-
-            if os.path.exists(src_lbl):
-                with open(src_lbl, "r") as f:
-                    lines = f.readlines()
-
-                new_lines = []
-                for line in lines:
-                    parts = line.strip().split()
-                    if parts:
-                        parts[0] = str(class_id)
-                        new_lines.append(" ".join(parts))
-
-                with open(dst_lbl, "w") as f:
-                    f.write("\n".join(new_lines))
-            else:
-                print(f"      Warning: No label file for {new_name}{ext}")
-
-print("\nDataset reorganization complete!")
-
-# Create data.yaml for YOLO
-data_yaml = {
-    "path": os.path.abspath(target_root),
-    "train": "train/images",
-    "val": "val/images",
-    "nc": len(class_names),
-    "names": {idx: name for name, meta in classes.items() for idx in [meta["id"]]}
-}
-
-with open(os.path.join(target_root, "data.yaml"), "w") as f:
-    yaml.dump(data_yaml, f, default_flow_style=False, sort_keys=False)
-
-print(f"\nCreated data.yaml with {len(class_names)} classes")
-print(f"Dataset structure:")
-print(f"  - {target_root}/train/images/")
-print(f"  - {target_root}/val/images/")
-print(f"  - {target_root}/train/labels/")
-print(f"  - {target_root}/val/labels/")
\ No newline at end of file
+IMAGE_EXTS = (".jpg", ".png", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+
+def process_file(job: tuple) -> str:
+    # Runs in a pool worker: copy one image and rewrite its label with the merged class id.
+    # Log lines are returned so the parent prints them instead of interleaving worker output.
+    src_img, dst_img, src_lbl, dst_lbl, class_id = job
+    img_name = os.path.basename(dst_img)
+
+    fast_copy(src_img, dst_img)
+    log = [f"    Copied: {img_name}"]
+
+    if os.path.exists(src_lbl):
+        new_lines = []
+        for line in Path(src_lbl).read_text().splitlines():
+            parts = line.split()
+            if parts:
+                parts[0] = str(class_id)
+                new_lines.append(" ".join(parts))
+
+        Path(dst_lbl).write_text("\n".join(new_lines))
+    else:
+        log.append(f"      Warning: No label file for {img_name}")
+
+    return "\n".join(log)
+
+
+def main() -> None:
+    # Create directory structure for YOLO dataset
+    for split in split_map.values():
+        os.makedirs(os.path.join(target_root, split, "images"), exist_ok=True)
+        os.makedirs(os.path.join(target_root, split, "labels"), exist_ok=True)
+
+    # Collect every copy/relabel job up front, then spread them over all cores
+    jobs = []
+    for animal, meta in classes.items():
+        class_id = meta["id"]
+        slug = meta["slug"]
+        print(f"\nProcessing {animal}...")
+
+        for src_split, dst_split in split_map.items():
+            img_dir = os.path.join(source_root, animal, src_split, "images")
+            lbl_dir = os.path.join(source_root, animal, src_split, "labels")
+
+            if not os.path.isdir(img_dir):
+                print(f"  Skipping {src_split} (directory not found)")
+                continue
+
+            with os.scandir(img_dir) as entries:
+                files = [
+                    e.name
+                    for e in entries
+                    if e.is_file() and e.name.lower().endswith(IMAGE_EXTS)
+                ]
+            print(f"  {src_split}: {len(files)} images found")
+
+            for file in files:
+                name, ext = os.path.splitext(file)
+                new_name = f"{slug}_{name}"
+
+                src_img = os.path.join(img_dir, file)
+                dst_img = os.path.join(target_root, dst_split, "images", f"{new_name}{ext}")
+
+                src_lbl = os.path.join(lbl_dir, f"{name}.txt")
+                dst_lbl = os.path.join(target_root, dst_split, "labels", f"{new_name}.txt")
+
+                jobs.append((src_img, dst_img, src_lbl, dst_lbl, class_id))
+
+    with Pool() as pool:
+        for log in pool.imap_unordered(process_file, jobs, chunksize=64):
+            print(log)
+
+    print("\nDataset reorganization complete!")
+
+    # Create data.yaml for YOLO
+    data_yaml = {
+        "path": os.path.abspath(target_root),
+        "train": "train/images",
+        "val": "val/images",
+        "nc": len(class_names),
+        "names": {idx: name for name, meta in classes.items() for idx in [meta["id"]]}
+    }
+
+    with open(os.path.join(target_root, "data.yaml"), "w") as f:
+        yaml.dump(data_yaml, f, default_flow_style=False, sort_keys=False)
+
+    print(f"\nCreated data.yaml with {len(class_names)} classes")
+    print(f"Dataset structure:")
+    print(f"  - {target_root}/train/images/")
+    print(f"  - {target_root}/val/images/")
+    print(f"  - {target_root}/train/labels/")
+    print(f"  - {target_root}/val/labels/")
+
+
+if __name__ == "__main__":
+    main()
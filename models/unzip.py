@@ -2,7 +2,6 @@ import os
 import zipfile
 import shutil
 import random
-import glob
 
 # Set random seed for reproducibility
 random.seed(42)
@@ -27,73 +26,68 @@ for zip_file in zip_files:
     
     # Path for extracting this specific zip
     extract_path = os.path.join(output_root, zip_name)
-    temp_extract_dir = os.path.join(output_root, f"{zip_name}_temp")
     
-    # Extract to a temporary directory first to easily find all files
+    # Only the selected pairs are ever written to disk, streamed straight out of the archive
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(temp_extract_dir)
+        members = [m for m in zip_ref.namelist() if not m.endswith('/')]
         
-    # Find all images
-    images = []
-    for ext in ('*.jpg', '*.JPG', '*.jpeg', '*.JPEG', '*.png', '*.PNG'):
-        images.extend(glob.glob(os.path.join(temp_extract_dir, '**', ext), recursive=True))
-        
-    # Find all labels
-    txt_files = glob.glob(os.path.join(temp_extract_dir, '**', '*.txt'), recursive=True)
-    label_dict = {}
-    for t in txt_files:
-        name = os.path.splitext(os.path.basename(t))[0]
-        # Skip roboflow metadata txt files
-        if name.lower() not in ['readme.roboflow', 'readme', 'classes', '_darknet.labels']:
-            label_dict[name] = t
-            
-    # Pair images and labels
-    pairs = []
-    for img_path in images:
-        base_name = os.path.splitext(os.path.basename(img_path))[0]
-        txt_path = label_dict.get(base_name)
-            
-        if txt_path and os.path.exists(txt_path):
-            pairs.append((img_path, txt_path))
+        # Find all images
+        images = [m for m in members if m.lower().endswith(('.jpg', '.jpeg', '.png'))]
             
-    # Shuffle for random selection
-    random.shuffle(pairs)
-    
-    # 350 for train, up to 150 for val
-    num_train = 350
-    num_val = 150
-    
-    train_pairs = pairs[:num_train]
-    val_pairs = pairs[num_train:num_train + num_val]
-    
-    print(f"  Found {len(pairs)} valid image/label pairs.")
-    print(f"  Allocating {len(train_pairs)} to train, {len(val_pairs)} to val.")
-    
-    # Define paths for final placement
-    train_img_dir = os.path.join(extract_path, "train", "images")
-    train_lbl_dir = os.path.join(extract_path, "train", "labels")
-    val_img_dir = os.path.join(extract_path, "val", "images")
-    val_lbl_dir = os.path.join(extract_path, "val", "labels")
-    
-    # Create directories
-    os.makedirs(train_img_dir, exist_ok=True)
-    os.makedirs(train_lbl_dir, exist_ok=True)
-    os.makedirs(val_img_dir, exist_ok=True)
-    os.makedirs(val_lbl_dir, exist_ok=True)
-    
-    # Function to copy files into their new structure
-    def place_pairs(selected_pairs, dest_img_dir, dest_lbl_dir):
-        for img_p, txt_p in selected_pairs:
-            img_name = os.path.basename(img_p)
-            txt_name = os.path.basename(txt_p)
-            shutil.copy(img_p, os.path.join(dest_img_dir, img_name))
-            shutil.copy(txt_p, os.path.join(dest_lbl_dir, txt_name))
-            
-    # Place files
-    place_pairs(train_pairs, train_img_dir, train_lbl_dir)
-    place_pairs(val_pairs, val_img_dir, val_lbl_dir)
-    
-    # Remove the temporary extracted directory explicitly to discard other files
-    shutil.rmtree(temp_extract_dir)
+        # Find all labels
+        label_dict = {}
+        for t in members:
+            if not t.endswith('.txt'):
+                continue
+            name = os.path.splitext(os.path.basename(t))[0]
+            # Skip roboflow metadata txt files
+            if name.lower() not in ['readme.roboflow', 'readme', 'classes', '_darknet.labels']:
+                label_dict[name] = t
+                
+        # Pair images and labels
+        pairs = []
+        for img_member in images:
+            base_name = os.path.splitext(os.path.basename(img_member))[0]
+            txt_member = label_dict.get(base_name)
+                
+            if txt_member:
+                pairs.append((img_member, txt_member))
+                
+        # Shuffle for random selection
+        random.shuffle(pairs)
+        
+        # 350 for train, up to 150 for val
+        num_train = 350
+        num_val = 150
+        
+        train_pairs = pairs[:num_train]
+        val_pairs = pairs[num_train:num_train + num_val]
+        
+        print(f"  Found {len(pairs)} valid image/label pairs.")
+        print(f"  Allocating {len(train_pairs)} to train, {len(val_pairs)} to val.")
+        
+        # Define paths for final placement
+        train_img_dir = os.path.join(extract_path, "train", "images")
+        train_lbl_dir = os.path.join(extract_path, "train", "labels")
+        val_img_dir = os.path.join(extract_path, "val", "images")
+        val_lbl_dir = os.path.join(extract_path, "val", "labels")
+        
+        # Create directories
+        os.makedirs(train_img_dir, exist_ok=True)
+        os.makedirs(train_lbl_dir, exist_ok=True)
+        os.makedirs(val_img_dir, exist_ok=True)
+        os.makedirs(val_lbl_dir, exist_ok=True)
+        
+        # Function to extract archive members into their new structure
+        def place_pairs(selected_pairs, dest_img_dir, dest_lbl_dir):
+            for img_m, txt_m in selected_pairs:
+                for member, dest_dir in ((img_m, dest_img_dir), (txt_m, dest_lbl_dir)):
+                    dest = os.path.join(dest_dir, os.path.basename(member))
+                    with zip_ref.open(member) as src, open(dest, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, length=1 << 20)
+                
+        # Place files
+        place_pairs(train_pairs, train_img_dir, train_lbl_dir)
+        place_pairs(val_pairs, val_img_dir, val_lbl_dir)
 
 print("All zips processed successfully.")
\ No newline at end of file
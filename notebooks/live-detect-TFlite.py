@@ -1,112 +1,402 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import cv2
 import numpy as np
 import tensorflow as tf
+import torch
+from numba import njit
 from ultralytics import YOLO
+from ultralytics.utils import ops
 
-# Load YOLO model (TFLite version)
-# Ultralytics automatically handles TFLite inference if tflite-runtime or tensorflow is installed
-try:
-    model = YOLO("notebooks/best-obj.tflite", task="detect")
-    print("TFLite model loaded successfully.")
-except Exception as e:
-    print(f"Error loading TFLite model: {e}")
-    print("Attempting to load best.pt fallback if available...")
+# Resizing and drawing run on small images; OpenCV's own thread pool only competes with the models
+cv2.setNumThreads(1)
+
+parser = argparse.ArgumentParser(description="Live YOLO detection with MiDaS distance estimation")
+parser.add_argument("--display", action=argparse.BooleanOptionalAction, default=True,
+                    help="show the annotated stream in a window (--no-display for headless runs)")
+args = parser.parse_args()
+
+# Thread budget: one core is kept for capture, drawing and display, the rest goes to the models that
+# run on the CPU at the same time. MiDaS always does; how much YOLO takes depends on the backend it
+# loads with (yolo_cpu_threads below).
+model_cores = max(2, (os.cpu_count() or 2) - 1)
+
+# Load YOLO model
+# On a CUDA machine the PyTorch weights run on the GPU in FP16 with conv+bn fused once up front;
+# the TFLite export is the CPU fallback. A TensorRT engine built by export.ipynb is preferred over the
+# PyTorch weights; it has FP16 and its 320x320 input shape baked in.
+yolo_engine_path = "notebooks/best.engine"
+yolo_tflite_path = "notebooks/best-obj.tflite"
+# YOLO runs at a fixed square input size: 320 for the PyTorch weights, while exported models (TensorRT,
+# TFLite) carry theirs in their metadata and are run at that size
+if torch.cuda.is_available() and os.path.exists(yolo_engine_path):
+    model = YOLO(yolo_engine_path, task="detect")
+    yolo_kwargs = {"device": 0}
+    yolo_cpu_threads = 0
+    print("TensorRT engine loaded.")
+elif torch.cuda.is_available():
     model = YOLO("notebooks/best.pt")
+    model.fuse()
+    yolo_kwargs = {"device": 0, "half": True, "imgsz": 320}
+    yolo_cpu_threads = 0
+    print("PyTorch model loaded on CUDA.")
+else:
+    # Ultralytics automatically handles TFLite inference if tflite-runtime or tensorflow is installed
+    try:
+        model = YOLO(yolo_tflite_path, task="detect")
+        yolo_kwargs = {}
+        # Ultralytics builds its own TFLite interpreter with its own thread count, which torch's setting
+        # does not reach; one core is set aside for it
+        yolo_cpu_threads = 1
+        print("TFLite model loaded successfully.")
+    except Exception as e:
+        print(f"Error loading TFLite model: {e}")
+        print("Attempting to load best.pt fallback if available...")
+        model = YOLO("notebooks/best.pt")
+        yolo_kwargs = {"imgsz": 320}
+        # Only here does YOLO run on PyTorch's CPU pool; it and MiDaS split the cores
+        yolo_cpu_threads = model_cores // 2
 
-# Load MiDaS TFLite model
+# Everywhere but the CPU best.pt fallback, PyTorch's own pool only prepares one small input tensor per
+# frame, so it is capped to a single thread
+midas_threads = model_cores - yolo_cpu_threads
+torch.set_num_threads(max(1, yolo_cpu_threads))
+
+# One predict() call on a blank frame sets up Ultralytics' predictor and its backend on the right device,
+# and settles the input size (from the export metadata for exported models); after that the loop feeds
+# the backend directly and runs NMS itself, skipping the per-call argument handling, callbacks and
+# Results construction of model(). Ultralytics' default thresholds are kept.
+YOLO_CONF = 0.25
+YOLO_IOU = 0.7
+model.predict(np.zeros((480, 640, 3), dtype=np.uint8), verbose=False, **yolo_kwargs)
+yolo_backend = model.predictor.model
+yolo_imgsz = model.predictor.imgsz[0]
 
-midas_path = "notebooks/midas_v21_small_256.tflite"
+# Frames are letterboxed into one persistent, contiguous buffer at yolo_imgsz. The padding is only
+# refilled when the frame size changes.
+yolo_input = np.empty((yolo_imgsz, yolo_imgsz, 3), dtype=np.uint8)
+letterbox_frame_size = None
+
+def letterbox_geometry(width, height):
+    # Scale, left/top offset and resized size of a width x height frame inside the YOLO input
+    scale = min(yolo_imgsz / width, yolo_imgsz / height)
+    new_w, new_h = round(width * scale), round(height * scale)
+    return scale, (yolo_imgsz - new_w) // 2, (yolo_imgsz - new_h) // 2, new_w, new_h
+
+def letterbox(frame):
+    global letterbox_frame_size
+    _, left, top, new_w, new_h = letterbox_geometry(frame.shape[1], frame.shape[0])
+    if letterbox_frame_size != frame.shape[:2]:
+        yolo_input.fill(114)
+        letterbox_frame_size = frame.shape[:2]
+    cv2.resize(frame, (new_w, new_h), dst=yolo_input[top:top + new_h, left:left + new_w],
+               interpolation=cv2.INTER_LINEAR)
+
+# Persistent normalized NCHW input on the backend's device; yolo_src shares memory with yolo_input
+yolo_tensor = torch.empty((1, 3, yolo_imgsz, yolo_imgsz), device=yolo_backend.device,
+                          dtype=torch.float16 if yolo_backend.fp16 else torch.float32)
+yolo_src = torch.from_numpy(yolo_input)
+
+@torch.inference_mode()
+def run_yolo(frame):
+    # Returns one [N, 6] tensor (x1, y1, x2, y2, conf, cls in letterboxed input coordinates) per image
+    letterbox(frame)
+    # BGR HWC uint8 -> RGB CHW in [0, 1]
+    yolo_tensor[0].copy_(yolo_src.to(yolo_backend.device, non_blocking=True).permute(2, 0, 1).flip(0))
+    yolo_tensor.mul_(1.0 / 255.0)
+    preds = yolo_backend(yolo_tensor)
+    return ops.non_max_suppression(preds, YOLO_CONF, YOLO_IOU)
+
+# Load MiDaS TFLite model
+# Prefer the full-integer MiDaS produced by export.ipynb when it exists
+midas_int8_path = "notebooks/midas_v21_small_256_int8.tflite"
+midas_path = midas_int8_path if os.path.exists(midas_int8_path) else "notebooks/midas_v21_small_256.tflite"
 print(f"Loading MiDaS TFLite model from {midas_path}...")
-interpreter = tf.lite.Interpreter(model_path=midas_path)
+# XNNPACK is TFLite's default CPU delegate (TF >= 2.5); it gets the MiDaS share of the thread budget
+interpreter = tf.lite.Interpreter(model_path=midas_path, num_threads=midas_threads)
 interpreter.allocate_tensors()
 
 input_details = interpreter.get_input_details()
 output_details = interpreter.get_output_details()
 input_shape = input_details[0]['shape'] # [1, 256, 256, 3]
 
-# Open webcam
-cap = cv2.VideoCapture(0)
-
-if not cap.isOpened():
-    print("Error: Could not open webcam.")
-    exit()
-
-print("Starting live detection... Press 'q' to quit.")
+# Depth changes slowly compared to the camera frame rate, so MiDaS only runs on every MIDAS_STRIDE-th
+# frame and later frames reuse the newest finished depth map, halving MiDaS work per frame.
+# MiDaS runs one frame per invoke: frames are never held back for their depth map, so in a batch
+# only the newest map would ever be used.
+MIDAS_STRIDE = 2
 
-while cap.isOpened():
-    ret, frame = cap.read()
-    if not ret:
-        print("Error: Failed to capture frame.")
-        break
+# Standard MiDaS normalization: mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225].
+# (x / 255 - mean) / std is folded into one per-channel scale and bias, applied into a persistent buffer.
+midas_mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+midas_std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+midas_scale = (1.0 / 255.0) / midas_std
+midas_bias = midas_mean / midas_std
+# Two input buffers: the next sampled frame is written into one while MiDaS runs on the other
+img_inputs = np.empty((2, 1, input_shape[1], input_shape[2], 3), dtype=np.float32)
+# The resized frame is written into a persistent buffer too, so preprocessing allocates nothing per frame
+resized_u8 = np.empty((input_shape[1], input_shape[2], 3), dtype=np.uint8)
 
-    # YOLO object detection
-    results = model(frame, verbose=False)
+# Full-integer model: fold its input quantization (q = x / scale + zero_point) into the same scale and
+# bias, then round into a persistent buffer of the model's input type
+midas_quantized = input_details[0]['dtype'] != np.float32
+if midas_quantized:
+    in_scale, in_zero_point = input_details[0]['quantization']
+    midas_scale = (midas_scale / in_scale).astype(np.float32)
+    midas_bias = (midas_bias / in_scale - in_zero_point).astype(np.float32)
+    in_info = np.iinfo(input_details[0]['dtype'])
+    img_input_q = np.empty(img_inputs.shape[1:], dtype=input_details[0]['dtype'])
+out_scale, out_zero_point = output_details[0]['quantization']
 
-    # MiDaS depth estimation using TFLite
-    img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    img_resized = cv2.resize(img, (input_shape[1], input_shape[2]))
-    img_input = img_resized.astype(np.float32) / 255.0
-    # Normalize with MiDaS specific values if needed, but often TFLite versions are simpler.
-    # Standard MiDaS normalization: mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]
-    img_input = (img_input - [0.485, 0.456, 0.406]) / [0.229, 0.224, 0.225]
-    img_input = np.expand_dims(img_input, axis=0).astype(np.float32)
+def write_midas_input(frame, buf):
+    # MiDaS preprocessing into one of the input buffers
+    # Resize the BGR frame as-is; the BGR->RGB swap happens inside the normalization pass
+    # through a channel-reversed view of the small resized image, not on the full frame
+    img_input = img_inputs[buf]
+    cv2.resize(frame, (input_shape[2], input_shape[1]), dst=resized_u8, interpolation=cv2.INTER_LINEAR)
+    np.multiply(resized_u8[..., ::-1], midas_scale, out=img_input[0], dtype=np.float32)
+    np.subtract(img_input[0], midas_bias, out=img_input[0])
 
-    interpreter.set_tensor(input_details[0]['index'], img_input)
+def run_midas(buf):
+    # MiDaS depth estimation using TFLite on one input buffer; returns its depth map
+    img_input = img_inputs[buf]
+    if midas_quantized:
+        np.rint(img_input, out=img_input)
+        np.clip(img_input, in_info.min, in_info.max, out=img_input)
+        np.copyto(img_input_q, img_input, casting='unsafe')
+        interpreter.set_tensor(input_details[0]['index'], img_input_q)
+    else:
+        interpreter.set_tensor(input_details[0]['index'], img_input)
     interpreter.invoke()
     prediction = interpreter.get_tensor(output_details[0]['index'])[0]
-    
-    # Resize depth map back to original frame size
-    depth_map = cv2.resize(prediction, (frame.shape[1], frame.shape[0]))
-
-    # Process YOLO results and draw bounding boxes
-    for r in results:
-        boxes = r.boxes
-        for box in boxes:
-            # Get coordinates
-            x1, y1, x2, y2 = box.xyxy[0]
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-            
-            # Get confidence and class
-            conf = float(box.conf[0])
-            cls = int(box.cls[0])
-            name = model.names[cls]
+    if prediction.dtype != np.float32:
+        prediction = (prediction.astype(np.float32) - out_zero_point) * out_scale
+    if prediction.ndim == 3: # Some outputs have shape (H, W, 1)
+        prediction = prediction[..., 0]
+    return prediction
 
-            # Calculate distance using depth map in the center of the bounding box
-            center_x, center_y = (x1 + x2) // 2, (y1 + y2) // 2
-            
-            # Ensure coordinates are within image boundaries
-            center_x = min(max(center_x, 0), frame.shape[1] - 1)
-            center_y = min(max(center_y, 0), frame.shape[0] - 1)
-            
-            # Use depth map value. Note: MiDaS provides inverse depth, so higher value means closer.
-            # Depth value is generally higher for closer objects.
-            depth_value = depth_map[center_y, center_x]
-            
-            # Normalize/approximate distance
-            # This constant 1000.0 is an approximation; calibration might be needed for real distances.
-            distance = 1000.0 / depth_value if depth_value > 0 else 0
-            
-            # Draw bounding box
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            
-            # Create label
-            label = f"{name} {conf:.2f} Dist: {distance:.2f}"
+@njit(cache=True, fastmath=True)
+def compute_dists(cx, cy, pred, width, height):
+    # Approximate distance for each box center (cx[i], cy[i]) in a width x height frame, from the median
+    # of the 3x3 neighbourhood (edge-clamped) around the center projected into the depth map.
+    # Note: MiDaS provides inverse depth, so higher value means closer.
+    # This constant 1000.0 is an approximation; calibration might be needed for real distances.
+    map_h, map_w = pred.shape
+    dists = np.zeros(cx.shape[0], dtype=np.float32)
+    window = np.empty(9, dtype=np.float32)
+    for i in range(cx.shape[0]):
+        px = cx[i] * map_w // width
+        py = cy[i] * map_h // height
+        k = 0
+        for dy in range(-1, 2):
+            row = min(max(py + dy, 0), map_h - 1)
+            for dx in range(-1, 2):
+                window[k] = pred[row, min(max(px + dx, 0), map_w - 1)]
+                k += 1
+        depth_value = np.median(window)
+        if depth_value > 0:
+            dists[i] = 1000.0 / depth_value
+    return dists
+
+# Hershey font digits all share one advance width, so labels that differ only in their digits
+# (confidence, distance) have the same size; they are mapped to one cache key by zeroing the digits
+DIGITS_TO_ZERO = str.maketrans("123456789", "000000000")
+
+@lru_cache(maxsize=256)
+def label_size(label_key):
+    return cv2.getTextSize(label_key, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
+
+def put_latest(q, item):
+    # Drop the oldest entry instead of blocking so a slow stage never backs up the ones before it
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            pass
+        q.put_nowait(item)
+
+def capture_loop(cap, frame_q, stop_event):
+    # Whatever ends this stage, including an exception, stops the whole pipeline
+    try:
+        while not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                print("Error: Failed to capture frame.")
+                break
+            put_latest(frame_q, frame)
+    finally:
+        stop_event.set()
+
+def inference_loop(frame_q, result_q, stop_event):
+    # Always works on the newest captured frame; frames that arrive while inference runs are dropped.
+    # Every MIDAS_STRIDE-th frame is written into the current input buffer and handed to MiDaS on a
+    # worker; the next sampled frame goes into the other buffer, so YOLO keeps running on the following
+    # frames while MiDaS is in flight; both release the GIL during native inference. A MiDaS result is
+    # only waited for when its buffer is needed again. The single worker keeps at most one MiDaS call
+    # running, since its interpreter is not thread-safe.
+    # Each frame is published right after YOLO with the newest finished depth map, which always comes
+    # from a sampled frame at or before it.
+    # Whatever ends this stage, including an exception, stops the whole pipeline
+    try:
+        futures = [None, None]
+        buf = 0
+        frame_count = 0
+        latest_depth = None
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            while not stop_event.is_set():
+                try:
+                    frame = frame_q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                if frame_count % MIDAS_STRIDE == 0:
+                    if futures[buf] is not None:
+                        latest_depth = futures[buf].result()
+                        futures[buf] = None
+                    write_midas_input(frame, buf)
+                    futures[buf] = pool.submit(run_midas, buf)
+                    buf = 1 - buf
+                frame_count += 1
+
+                # YOLO object detection
+                results = run_yolo(frame)
+
+                # Pick up finished depth maps without waiting, older one first
+                for b in (buf, 1 - buf):
+                    if futures[b] is not None and futures[b].done():
+                        latest_depth = futures[b].result()
+                        futures[b] = None
+                if latest_depth is not None:
+                    put_latest(result_q, (frame, results, latest_depth))
+    finally:
+        stop_event.set()
+
+def draw_loop(result_q, display_q, stop_event):
+    # Drawing runs here so the main thread only has to show finished frames. Headless runs skip the
+    # drawing and print each detection instead.
+    # Whatever ends this stage, including an exception, stops the whole pipeline
+    try:
+        while not stop_event.is_set():
+            try:
+                frame, results, prediction = result_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            # Process YOLO results and draw bounding boxes
+            # All box fields come over in a single device->host transfer per image (the [N, 6] NMS output:
+            # x1, y1, x2, y2, conf, cls) and are transposed once into one contiguous array per field.
+            # Centers are computed for all detections at once and distances in one compiled pass over the
+            # model-resolution depth map, leaving only the drawing per box.
+            # Boxes are in letterboxed YOLO input coordinates and are mapped back to, and clipped to, the frame first.
+            height, width = frame.shape[:2]
+            scale, left, top, _, _ = letterbox_geometry(width, height)
+            for det in results:
+                fields = np.ascontiguousarray(det.cpu().numpy().T)
+                x1 = ((fields[0] - left) / scale).astype(np.int32)
+                y1 = ((fields[1] - top) / scale).astype(np.int32)
+                x2 = ((fields[2] - left) / scale).astype(np.int32)
+                y2 = ((fields[3] - top) / scale).astype(np.int32)
+                for coords, limit in ((x1, width - 1), (y1, height - 1), (x2, width - 1), (y2, height - 1)):
+                    np.clip(coords, 0, limit, out=coords)
+                confs = fields[4]
+                clss = fields[5].astype(np.int32)
+
+                # Calculate distance using depth map in the center of the bounding box
+                # (centers clamped to the image boundaries)
+                cx = (x1 + x2) >> 1
+                cy = (y1 + y2) >> 1
+                np.clip(cx, 0, width - 1, out=cx)
+                np.clip(cy, 0, height - 1, out=cy)
+                dists = compute_dists(cx, cy, prediction, width, height)
+
+                for bx1, by1, bx2, by2, conf, cls, distance in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist(),
+                                                                   confs.tolist(), clss.tolist(), dists.tolist()):
+                    name = model.names[cls]
+
+                    # Create label
+                    label = f"{name} {conf:.2f} Dist: {distance:.2f}"
+                    if not args.display:
+                        print(f"Object: {name}, Confidence: {conf:.2f}, Box: [{bx1},{by1},{bx2},{by2}], Dist: {distance:.2f}")
+                        continue
+
+                    # Draw bounding box
+                    cv2.rectangle(frame, (bx1, by1), (bx2, by2), (0, 255, 0), 2)
             
-            # Draw label background
-            (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-            cv2.rectangle(frame, (x1, y1 - 25), (x1 + w, y1), (0, 255, 0), -1)
+                    # Draw label background
+                    w, h = label_size(label.translate(DIGITS_TO_ZERO))
+                    cv2.rectangle(frame, (bx1, by1 - 25), (bx1 + w, by1), (0, 255, 0), -1)
             
-            # Draw text
-            cv2.putText(frame, label, (x1, y1 - 7), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+                    # Draw text
+                    cv2.putText(frame, label, (bx1, by1 - 7), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+
+            if args.display:
+                put_latest(display_q, frame)
+    finally:
+        stop_event.set()
+
+# Open webcam
+# V4L2 directly on Linux; MJPG cuts USB bandwidth, and a one-frame driver buffer keeps reads from
+# returning stale frames. Backends that do not support a setting ignore it.
+cap = cv2.VideoCapture(0, cv2.CAP_V4L2) if sys.platform.startswith("linux") else cv2.VideoCapture(0)
+cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+if not cap.isOpened():
+    print("Error: Could not open webcam.")
+    exit()
 
-    # Show the result
-    cv2.imshow("Live TFLite Detection & Distance Estimation", frame)
+print("Starting live detection... Press " + ("'q'" if args.display else "Ctrl+C") + " to quit.")
+
+# Capture, inference and drawing run on their own threads, connected by one-slot queues that drop their
+# oldest item when full. HighGUI (imshow/waitKey) has to run on the main thread on macOS and with some
+# Qt builds, so the main thread only shows the finished frames.
+frame_q = queue.Queue(maxsize=1)
+result_q = queue.Queue(maxsize=1)
+display_q = queue.Queue(maxsize=1)
+stop_event = threading.Event()
+workers = [
+    threading.Thread(target=capture_loop, args=(cap, frame_q, stop_event), daemon=True),
+    threading.Thread(target=inference_loop, args=(frame_q, result_q, stop_event), daemon=True),
+    threading.Thread(target=draw_loop, args=(result_q, display_q, stop_event), daemon=True),
+]
+for worker in workers:
+    worker.start()
+
+try:
+    while not stop_event.is_set():
+        if not args.display:
+            # Headless: nothing to show, just wait for Ctrl+C or the camera to stop
+            stop_event.wait(0.1)
+            continue
+        try:
+            frame = display_q.get(timeout=0.1)
+        except queue.Empty:
+            # Keep the window responsive (and 'q' working) while waiting for the next frame
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+            continue
 
-    # Stop if 'q' is pressed
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+        # Show the result
+        cv2.imshow("Live TFLite Detection & Distance Estimation", frame)
 
-# Cleanup
-cap.release()
-cv2.destroyAllWindows()
-print("Webcam closed.")
+        # Stop if 'q' is pressed
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+except KeyboardInterrupt:
+    pass
+finally:
+    # Cleanup
+    stop_event.set()
+    for worker in workers:
+        worker.join()
+    cap.release()
+    if args.display:
+        cv2.destroyAllWindows()
+    print("Webcam closed.")